@@ -1,20 +1,233 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import atexit
+import multiprocessing
+import shelve
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import httpx
+from selectolax.lexbor import LexborHTMLParser
 import os
 import re
 from urllib.parse import quote
 
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
+
+# Read/write images in 64 KiB blocks to keep per-chunk overhead and memory low
+_CHUNK_SIZE = 1 << 16
+
+# Conditional-GET cache; entries older than this are dropped
+_CACHE_PATH = '.3asq_cache'
+_CACHE_MAX_AGE = 7 * 24 * 3600
+
+# CSS selectors, shared by every parse instead of rebuilt per call.
+# Title links inside search result containers (.post-title a also covers the h3/h4 variants)
+_SEARCH_TITLE_SEL = (
+    ".c-tabs-item__content .post-title a, .tab-content-wrap .post-title a, .c-tabs-item .post-title a"
+)
+_CHAPTER_SEL = ".wp-manga-chapter a, .chapter-li a, .listing-chapters_wrap li a"
+_IMG_SEL = ".wp-manga-chapter-img"
+
+# Parse chapter pages in a process pool only for runs at least this big;
+# below that, process startup and pickling cost more than the parsing itself
+_POOL_MIN_CHAPTERS = 8
+# ProcessPoolExecutor rejects more than 61 workers on Windows
+_POOL_MAX_WORKERS = 61
+
+# Bytes patterns, matched against the raw body so it is never decoded to str
+_POSTID_RE = re.compile(rb'postid-(\d+)')
+_DATAID_RE = re.compile(rb'data-id="(\d+)"')
+# \w is Unicode-aware, so Arabic titles keep their letters like with str.isalpha()
+_SANITIZE_RE = re.compile(r'[^\w .-]+')
+
+
+def _safe_name(name):
+    return _SANITIZE_RE.sub('', name).strip()
+
+
+def _lock_file(path):
+    """
+    Takes a non-blocking exclusive lock on path, released when the fd is closed (or the process exits).
+    Raises OSError if another process holds it.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        raise
+    return fd
+
+
+async def _stream_atomic(resp, filepath):
+    """
+    Streams resp into filepath via a .part file, so an interrupted run never leaves a truncated page behind.
+    The file is opened once; each chunk is written in the default executor to keep disk I/O off the loop.
+    """
+    loop = asyncio.get_running_loop()
+    tmp = filepath + '.part'
+    try:
+        f = await loop.run_in_executor(None, open, tmp, 'wb')
+        try:
+            async for chunk in resp.aiter_bytes(_CHUNK_SIZE):
+                await loop.run_in_executor(None, f.write, chunk)
+        finally:
+            await loop.run_in_executor(None, f.close)
+        os.replace(tmp, filepath)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _extract_image_urls(html):
+    """
+    Pulls page image URLs out of a chapter page. Module-level so it can run in a process pool.
+    """
+    pages = []
+    images = LexborHTMLParser(html).css(_IMG_SEL)
+
+    for img in images:
+        attrs = img.attributes
+        src = attrs.get('data-src') or attrs.get('data-lazy-src') or attrs.get('src')
+        if src:
+            pages.append(src.strip())
+
+    return pages
+
 class ThreeAsqProvider:
     def __init__(self):
         self.api = "https://3asq.org"
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Referer": self.api + "/",
-            "X-Requested-With": "XMLHttpRequest"
+            "Referer": self.api + "/"
+        }
+        # Plain page loads: no XHR marker, so WordPress serves compressed HTML.
+        # Accept-Encoding is left to httpx, which only advertises codecs it can decode.
+        self._html_headers = {**self.headers, "Accept": "text/html"}
+        # admin-ajax and the chapters AJAX endpoint expect to be called via XHR
+        self._ajax_headers = {
+            **self.headers,
+            "X-Requested-With": "XMLHttpRequest",
+            "Content-Type": "application/x-www-form-urlencoded"
         }
 
+        # Chapter directories already created during this run
+        self._dirs_made = set()
+
+        self.limits = httpx.Limits(max_connections=16, max_keepalive_connections=16)
+
+        # Keep-alive HTTP/2 client so the TLS handshake is paid once, not per request
+        self.s = httpx.Client(
+            headers=self.headers,
+            transport=httpx.HTTPTransport(http2=True, limits=self.limits, retries=3),
+            follow_redirects=True,
+            timeout=30
+        )
+
+        # url -> {'etag', 'last_modified', 'body', 'stored'} for conditional GETs across runs.
+        # Opened on first use; None if unavailable (e.g. another run holds it).
+        self._http_cache = None
+        self._cache_lock = None
+        self._cache_opened = False
+        # Every shelf call (open, read, write, close) runs on this one thread: it keeps
+        # dbm I/O off the event loop, serializes access, and satisfies backends with
+        # thread affinity (dbm.sqlite3, the default on 3.13+, rejects cross-thread use).
+        self._cache_io = ThreadPoolExecutor(max_workers=1)
+
+    def close(self):
+        self.s.close()
+        self._cache_io.submit(self._close_cache).result()
+        self._cache_io.shutdown()
+
+    def _close_cache(self):
+        if self._http_cache is not None:
+            self._http_cache.close()
+            self._http_cache = None
+        if self._cache_lock is not None:
+            os.close(self._cache_lock)
+            self._cache_lock = None
+
+    def _cache(self):
+        if self._cache_opened:
+            return self._http_cache
+        self._cache_opened = True
+
+        try:
+            # dbm.dumb has no locking of its own, so guard every backend with a lock file
+            self._cache_lock = _lock_file(_CACHE_PATH + '.lock')
+            self._http_cache = shelve.open(_CACHE_PATH, flag='c')
+        except Exception as e:
+            print(f"HTTP cache unavailable, continuing without it: {e}")
+            if self._cache_lock is not None:
+                os.close(self._cache_lock)
+                self._cache_lock = None
+            return None
+
+        now = time.time()
+        stale = [url for url, entry in self._http_cache.items()
+                 if now - entry.get('stored', 0) > _CACHE_MAX_AGE]
+        for url in stale:
+            del self._http_cache[url]
+
+        return self._http_cache
+
+    def _conditional_headers(self, url):
+        headers = dict(self._html_headers)
+        cache = self._cache()
+        entry = cache.get(url) if cache is not None else None
+        if not entry:
+            return headers
+
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def _cached_body(self, url, resp):
+        """
+        Returns the cached body on 304, otherwise stores the fresh one if it has validators.
+        """
+        cache = self._cache()
+        if cache is None:
+            return resp.content
+
+        if resp.status_code == 304 and url in cache:
+            entry = cache[url]
+            entry['stored'] = time.time()
+            cache[url] = entry
+            return entry['body']
+
+        body = resp.content
+        etag = resp.headers.get('ETag')
+        last_modified = resp.headers.get('Last-Modified')
+        if resp.status_code == 200 and (etag or last_modified):
+            cache[url] = {'etag': etag, 'last_modified': last_modified, 'body': body, 'stored': time.time()}
+        return body
+
+    def _async_client(self):
+        """
+        HTTP/2 client for the async paths (bulk page lists and image downloads).
+        """
+        return httpx.AsyncClient(
+            headers=self.headers,
+            transport=httpx.AsyncHTTPTransport(http2=True, limits=self.limits, retries=3),
+            follow_redirects=True,
+            timeout=30
+        )
+
     def _get_soup(self, html):
-        return BeautifulSoup(html, 'html.parser')
+        return LexborHTMLParser(html)
 
     def search(self, query):
         """
@@ -24,26 +237,28 @@ class ThreeAsqProvider:
         url = f"{self.api}/?s={quote(query)}&post_type=wp-manga"
         
         try:
-            resp = requests.get(url, headers=self.headers)
-            soup = self._get_soup(resp.text)
+            resp = self.s.get(url, headers=self._html_headers)
+            tree = self._get_soup(resp.content)
             
             results = []
             seen_slugs = set()
 
-            containers = soup.select(".c-tabs-item__content, .tab-content-wrap, .c-tabs-item, .row.c-tabs-item__content")
+            # One traversal for all title links; overlapping containers are handled by seen_slugs
+            anchors = tree.css(_SEARCH_TITLE_SEL)
             
-            for el in containers:
-                title_el = el.select_one(".post-title h3 a, .post-title h4 a, .post-title a")
-                if not title_el:
+            for title_el in anchors:
+                title = title_el.text(strip=True)
+                href = title_el.attributes.get('href')
+                if not href:
                     continue
-
-                title = title_el.get_text(strip=True)
-                href = title_el.get('href')
                 
-                slug_match = re.search(r'/manga/([^/]+)/', href)
-                if not slug_match:
+                # href looks like https://3asq.org/manga/<slug>/
+                parts = href.split('/manga/', 1)
+                if len(parts) != 2:
+                    continue
+                slug, sep, _ = parts[1].partition('/')
+                if not slug or not sep:
                     continue
-                slug = slug_match.group(1)
 
                 if slug in seen_slugs:
                     continue
@@ -68,37 +283,39 @@ class ThreeAsqProvider:
         manga_url = f"{self.api}/manga/{manga_slug}/"
         print(f"Fetching chapters from: {manga_url}")
         
-        resp = requests.get(manga_url, headers=self.headers)
-        html = resp.text
-        soup = self._get_soup(html)
+        headers = self._cache_io.submit(self._conditional_headers, manga_url).result()
+        resp = self.s.get(manga_url, headers=headers)
+        html = self._cache_io.submit(self._cached_body, manga_url, resp).result()
+        tree = self._get_soup(html)
         
         # 1. Try finding chapters directly (SSR)
-        chapters = self._parse_chapters(soup, manga_slug)
+        chapters = self._parse_chapters(tree, manga_slug)
         
         # 2. AJAX Fallback
         if not chapters:
             print("No chapters found in initial page, trying AJAX...")
-            post_id_match = re.search(r'postid-(\d+)', html) or re.search(r'data-id="(\d+)"', html)
+            post_id_match = _POSTID_RE.search(html) or _DATAID_RE.search(html)
             
             if post_id_match:
-                post_id = post_id_match.group(1)
+                post_id = post_id_match.group(1).decode()
                 ajax_url = f"{self.api}/wp-admin/admin-ajax.php"
                 try:
-                    ajax_resp = requests.post(
+                    ajax_resp = self.s.post(
                         ajax_url, 
-                        headers={**self.headers, "Content-Type": "application/x-www-form-urlencoded"},
-                        data=f"action=manga_get_chapters&manga={post_id}"
+                        headers=self._ajax_headers,
+                        content=f"action=manga_get_chapters&manga={post_id}"
                     )
                     
-                    if len(ajax_resp.text) > 5 and ajax_resp.text != "0":
-                        ajax_soup = self._get_soup(ajax_resp.text)
-                        chapters = self._parse_chapters(ajax_soup, manga_slug)
+                    ajax_body = ajax_resp.content
+                    if len(ajax_body) > 5 and ajax_body != b"0":
+                        ajax_tree = self._get_soup(ajax_body)
+                        chapters = self._parse_chapters(ajax_tree, manga_slug)
                     else:
                         print("Standard AJAX failed, trying direct AJAX...")
                         direct_ajax_url = f"{self.api}/manga/{manga_slug}/ajax/chapters/"
-                        direct_resp = requests.post(direct_ajax_url, headers=self.headers)
-                        direct_soup = self._get_soup(direct_resp.text)
-                        chapters = self._parse_chapters(direct_soup, manga_slug)
+                        direct_resp = self.s.post(direct_ajax_url, headers=self._ajax_headers)
+                        direct_tree = self._get_soup(direct_resp.content)
+                        chapters = self._parse_chapters(direct_tree, manga_slug)
                         
                 except Exception as e:
                     print(f"AJAX error: {e}")
@@ -110,25 +327,33 @@ class ThreeAsqProvider:
             
         return chapters
 
-    def _parse_chapters(self, soup, manga_slug):
+    def _parse_chapters(self, tree, manga_slug):
         chapters = []
-        elements = soup.select(".wp-manga-chapter, .chapter-li, .listing-chapters_wrap li")
-        
-        for el in elements:
-            a_tag = el.find('a')
-            if not a_tag:
-                continue
-                
-            href = a_tag.get('href')
+        seen_slugs = set()
+
+        # Lexbor returns a node once per selector group it matches, so on the usual
+        # markup (.listing-chapters_wrap li.wp-manga-chapter) every chapter comes back
+        # twice. Dedupe by slug; the first link in document order wins, which also
+        # skips extra links to the same chapter such as the "new" badge.
+        for a_tag in tree.css(_CHAPTER_SEL):
+            href = a_tag.attributes.get('href')
             if not href or manga_slug not in href:
                 continue
 
-            slug_match = re.search(r'/manga/[^/]+/([^/]+)/', href)
-            if not slug_match:
+            # href looks like https://3asq.org/manga/<slug>/<chapter>/
+            parts = href.split('/manga/', 1)
+            if len(parts) != 2:
+                continue
+            manga_part, _, rest = parts[1].partition('/')
+            chapter_slug, sep, _ = rest.partition('/')
+            if not manga_part or not chapter_slug or not sep:
+                continue
+
+            if chapter_slug in seen_slugs:
                 continue
+            seen_slugs.add(chapter_slug)
             
-            chapter_slug = slug_match.group(1)
-            title = a_tag.get_text(strip=True)
+            title = a_tag.text(strip=True)
             
             chapters.append({
                 'title': title,
@@ -142,48 +367,85 @@ class ThreeAsqProvider:
         url = f"{self.api}/manga/{manga_slug}/{chapter_slug}/"
         # print(f"Fetching images from: {url}") # Reduced noise
         
-        resp = requests.get(url, headers=self.headers)
-        soup = self._get_soup(resp.text)
-        
-        pages = []
-        images = soup.select(".wp-manga-chapter-img")
-        
-        for img in images:
-            src = img.get('data-src') or img.get('data-lazy-src') or img.get('src')
-            if src:
-                pages.append(src.strip())
-                
-        return pages
+        headers = self._cache_io.submit(self._conditional_headers, url).result()
+        resp = self.s.get(url, headers=headers)
+        return _extract_image_urls(self._cache_io.submit(self._cached_body, url, resp).result())
+
+    async def get_pages_async(self, client, manga_slug, chapter_slug, executor=None):
+        """
+        Async variant of get_pages for bulk downloads. Returns (chapter_slug, pages).
+        Parsing runs in executor (default: the loop's thread pool).
+        """
+        url = f"{self.api}/manga/{manga_slug}/{chapter_slug}/"
+
+        # dbm reads/writes are blocking, run them on the cache thread
+        loop = asyncio.get_running_loop()
+        headers = await loop.run_in_executor(self._cache_io, self._conditional_headers, url)
+        r = await client.get(url, headers=headers)
+        body = await loop.run_in_executor(self._cache_io, self._cached_body, url, r)
 
-    def download_chapter(self, manga_title, chapter_title, pages):
-        safe_manga = "".join([c for c in manga_title if c.isalpha() or c.isdigit() or c in " .-_"]).strip()
-        safe_chapter = "".join([c for c in chapter_title if c.isalpha() or c.isdigit() or c in " .-_"]).strip()
+        # Parsing is CPU-bound, keep it off the event loop
+        pages = await loop.run_in_executor(executor, _extract_image_urls, body)
+        return chapter_slug, pages
+
+    async def download_chapter(self, manga_dir, chapter_title, pages, client=None, sem=None, concurrency=8):
+        """
+        Downloads pages into manga_dir/<chapter>. manga_dir is created by the caller.
+        Pass a shared sem to cap image requests across several chapters.
+        """
+        if client is None:
+            async with self._async_client() as client:
+                return await self.download_chapter(manga_dir, chapter_title, pages, client, sem, concurrency)
+
+        safe_chapter = _safe_name(chapter_title)
         
-        path = os.path.join("downloads", safe_manga, safe_chapter)
-        os.makedirs(path, exist_ok=True)
+        path = os.path.join(manga_dir, safe_chapter)
+        if path not in self._dirs_made:
+            os.makedirs(path, exist_ok=True)
+            self._dirs_made.add(path)
         
         print(f"Downloading {len(pages)} pages to: {safe_chapter}")
-        
+
+        # One directory read instead of a stat() per page
+        try:
+            with os.scandir(path) as it:
+                existing = {e.name for e in it}
+        except FileNotFoundError:
+            existing = set()
+
+        if sem is None:
+            sem = asyncio.Semaphore(concurrency)
+
+        async def _fetch(page_no, url, filename, filepath):
+            try:
+                async with sem, client.stream('GET', url) as r:
+                    if r.status_code == 200:
+                        await _stream_atomic(r, filepath)
+                        existing.add(filename)
+            except Exception as e:
+                print(f"Failed to download page {page_no}: {e}")
+
+        tasks = []
         for i, url in enumerate(pages):
-            ext = url.split('.')[-1]
+            # Drop any query string so "x.jpg?v=123" still yields "jpg"
+            clean = url.partition('?')[0]
+            _, dot, ext = clean.rpartition('.')
+            if not dot or not ext or '/' in ext:
+                ext = 'jpg'
             filename = f"{i+1:03d}.{ext}"
             filepath = os.path.join(path, filename)
-            
-            if os.path.exists(filepath):
+
+            if filename in existing:
                 continue
-                
-            try:
-                img_resp = requests.get(url, headers=self.headers, stream=True)
-                if img_resp.status_code == 200:
-                    with open(filepath, 'wb') as f:
-                        for chunk in img_resp.iter_content(1024):
-                            f.write(chunk)
-            except Exception as e:
-                print(f"Failed to download page {i+1}: {e}")
+
+            tasks.append(_fetch(i + 1, url, filename, filepath))
+
+        await asyncio.gather(*tasks)
 
 # --- Main Execution Flow ---
 if __name__ == "__main__":
     app = ThreeAsqProvider()
+    atexit.register(app.close)
     
     # 1. Search
     query = input("Enter manga name to search: ")
@@ -253,11 +515,59 @@ if __name__ == "__main__":
         print("No chapters selected.")
         exit()
 
-    for chap in target_chapters:
-        pages = app.get_pages(selected_manga['slug'], chap['slug'])
-        if pages:
-            app.download_chapter(selected_manga['title'], chap['title'], pages)
-        else:
-            print(f"No pages found for {chap['title']}")
+    manga_dir = os.path.join("downloads", _safe_name(selected_manga['title']))
+    os.makedirs(manga_dir, exist_ok=True)
+
+    async def _run():
+        by_slug = {chap['slug']: chap for chap in target_chapters}
+        # Page-list and image requests share one 16-connection client; keep the
+        # sum of both at or below that so nothing waits out the pool timeout.
+        sem = asyncio.Semaphore(8)
+        download_sem = asyncio.Semaphore(8)
+
+        # Parse chapter pages on every core for bulk runs, the GIL would serialize a thread pool
+        pool = None
+        if len(target_chapters) >= _POOL_MIN_CHAPTERS:
+            # spawn, not fork: the cache and executor threads are already running,
+            # and forking a multi-threaded process can deadlock the child
+            pool = ProcessPoolExecutor(
+                max_workers=min(os.cpu_count() or 1, _POOL_MAX_WORKERS),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+
+        try:
+            async with app._async_client() as client:
+
+                async def _pages(chap):
+                    async with sem:
+                        return await app.get_pages_async(client, selected_manga['slug'], chap['slug'], pool)
+
+                # Start each chapter's download as soon as its page list is known
+                downloads = []
+                for fut in asyncio.as_completed([_pages(chap) for chap in target_chapters]):
+                    try:
+                        chapter_slug, pages = await fut
+                    except Exception as e:
+                        print(f"Failed to fetch pages: {e}")
+                        continue
+
+                    chap = by_slug[chapter_slug]
+                    if pages:
+                        downloads.append(asyncio.create_task(
+                            app.download_chapter(manga_dir, chap['title'], pages, client, download_sem)
+                        ))
+                    else:
+                        print(f"No pages found for {chap['title']}")
+
+                await asyncio.gather(*downloads)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    # libuv-based loop, cheaper scheduling for thousands of page tasks
+    if uvloop is not None:
+        uvloop.run(_run())
+    else:
+        asyncio.run(_run())
 
     print("\nAll tasks finished.")